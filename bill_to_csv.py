@@ -19,13 +19,19 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import base64
 import csv
 import datetime
+import functools
 import getpass
+import hashlib
+import io
+import json
 import os
 import PyPDF2
+import re
 import shutil
-import tabula
+import sys
 import tkinter
 
 import numpy as np
@@ -34,6 +40,9 @@ import pandas as pd
 from dateutil import relativedelta
 from tkinter import filedialog
 
+# Bump when parsing of bills changes so that cached transactions are reparsed.
+_PARSER_VERSION = 1
+
 
 def read_file(title, initialdir):
     root = tkinter.Tk()
@@ -95,27 +104,51 @@ class AndroMoney(object):
 
     def _init_expenses(self):
         """Gets expenses and sorts them by date.
+
+        Remembers byte offset, number of rows, and checksum of parsed file 
+        for reload to parse appended rows only.
         """
-        df = pd.read_csv(self._file, encoding='cp950', header=1)
+        with open(self._file, mode='rb') as f:
+            data = f.read()
+
+        df = pd.read_csv(io.BytesIO(data), encoding='cp950', header=1)
+        self._offset = len(data)
+        self._num_rows = len(df.index)
+        self._checksum = hashlib.sha256(data).hexdigest()
+        self._ends_with_newline = data.endswith(b'\n')
+        self._expenses = self._select_expenses(df)
+
+    def _select_expenses(self, df):
+        """Returns expenses of rows sorted by date."""
         df = df[pd.notnull(df[self._fieldnames['outflow']])]
         df = df[pd.isnull(df[self._fieldnames['inflow']])]
-        self._expenses = df.sort_values(by=self._fieldnames['date'])
+        return df.sort_values(by=self._fieldnames['date'])
+
+    def _date_divide(self, delta):
+        """Returns date string of today shifted by delta."""
+        return (datetime.date.today() + delta).strftime('%Y%m%d')
+
+    def _count_categories(self, expenses, date_divide):
+        """Returns numbers of expenses of categories after date_divide."""
+        expenses_divide = expenses[
+            expenses[self._fieldnames['date']] > int(date_divide)]
+        return expenses_divide.groupby(by=[
+            self._fieldnames['category'], self._fieldnames['sub_category']
+        ]).size()
 
     def _init_frequently_used_categories(self):
         """Initializes frequently used categories.
         
         Initializes codes and levels of frequently used categories.
         """
-        expenses = self._expenses
         six_months_ago = relativedelta.relativedelta(months=-6)
-        date_divide = (datetime.date.today() +
-                       six_months_ago).strftime('%Y%m%d')
-        expenses_divide = expenses[
-            expenses[self._fieldnames['date']] > int(date_divide)]
-        s = expenses_divide.groupby(by=[
-            self._fieldnames['category'], self._fieldnames['sub_category']
-        ]).size()
-        s = s.sort_values(ascending=False)
+        self._date_divide_frequent = self._date_divide(six_months_ago)
+        self._counts_frequent = self._count_categories(
+            self._expenses, self._date_divide_frequent)
+        self._set_frequently_used_categories()
+
+    def _set_frequently_used_categories(self):
+        s = self._counts_frequent.sort_values(ascending=False)
         self._codes_frequent = s.index.codes
         self._levels_frequent = s.index.levels
 
@@ -169,17 +202,84 @@ class AndroMoney(object):
         
         Initializes codes and levels of all categories.
         """
-        expenses = self._expenses
         one_year_ago = relativedelta.relativedelta(years=-1)
-        date_divide = (datetime.date.today() + one_year_ago).strftime('%Y%m%d')
-        expenses_divide = expenses[
-            expenses[self._fieldnames['date']] > int(date_divide)]
-        s = expenses_divide.groupby(by=[
-            self._fieldnames['category'], self._fieldnames['sub_category']
-        ]).size()
+        self._date_divide_all = self._date_divide(one_year_ago)
+        self._counts_all = self._count_categories(self._expenses,
+                                                  self._date_divide_all)
+        self._set_all_categories()
+
+    def _set_all_categories(self):
+        s = self._counts_all
         self._codes_all = s.index.codes
         self._levels_all = s.index.levels
 
+    def reload(self):
+        """Reloads AndroMoney file.
+
+        Parses only rows appended since the last parse and merges them into 
+        expenses and categories. Fully reparses file if previously parsed part 
+        of file was rewritten.
+        """
+        with open(self._file, mode='rb') as f:
+            data = f.read()
+
+        prefix = data[:self._offset]
+        # True if previously parsed part of file is unchanged.
+        if (len(data) >= self._offset and self._ends_with_newline and
+                hashlib.sha256(prefix).hexdigest() == self._checksum):
+            self._append_expenses(data)
+        else:
+            self._init_fieldnames()
+            self._init_expenses()
+            self._init_frequently_used_categories()
+            self._init_all_categories()
+
+    def _append_expenses(self, data):
+        """Merges rows appended after offset into expenses and categories.
+
+        Args:
+            data: Content of file starting with previously parsed part.
+        """
+        tail = data[self._offset:]
+        if tail.strip():
+            df = pd.read_csv(io.BytesIO(tail),
+                             encoding='cp950',
+                             header=None,
+                             names=self._all_fieldnames)
+            df.index += self._num_rows
+            new_expenses = self._select_expenses(df)
+
+            self._offset = len(data)
+            self._num_rows += len(df.index)
+            self._checksum = hashlib.sha256(data).hexdigest()
+            self._ends_with_newline = data.endswith(b'\n')
+            self._expenses = pd.concat([
+                self._expenses, new_expenses
+            ]).sort_values(by=self._fieldnames['date'])
+        else:
+            new_expenses = None
+
+        # Counts are recounted if periods of categories moved since last parse,
+        # even if no rows were appended.
+        six_months_ago = relativedelta.relativedelta(months=-6)
+        if self._date_divide(six_months_ago) != self._date_divide_frequent:
+            self._init_frequently_used_categories()
+        elif new_expenses is not None:
+            self._counts_frequent = self._counts_frequent.add(
+                self._count_categories(new_expenses,
+                                       self._date_divide_frequent),
+                fill_value=0).astype('int64')
+            self._set_frequently_used_categories()
+
+        one_year_ago = relativedelta.relativedelta(years=-1)
+        if self._date_divide(one_year_ago) != self._date_divide_all:
+            self._init_all_categories()
+        elif new_expenses is not None:
+            self._counts_all = self._counts_all.add(
+                self._count_categories(new_expenses, self._date_divide_all),
+                fill_value=0).astype('int64')
+            self._set_all_categories()
+
     def output_all_categories(self, output_file):
         """Outputs CSV file of all categories.
         
@@ -280,24 +380,163 @@ class AndroMoney(object):
                 })
 
 
-def read_hsbc(file):
+def _read_hsbc_tables_tabula(file, password, pdf, start_page):
+    """Returns tables of HSBC credit card bill extracted by tabula.
+
+    Requires Java runtime.
+    """
+    # Imported here so that other backends work without tabula installed.
+    import tabula
+
+    number_of_pages = pdf.getNumPages()
+    pages = str(start_page) + '-' + str(number_of_pages)
+    return tabula.read_pdf(file,
+                           password=password,
+                           pages=pages,
+                           pandas_options={'header': None})
+
+
+def _read_chars(layout_object):
+    """Returns characters in layout object of pdfminer, including figures."""
+    from pdfminer import layout
+
+    if isinstance(layout_object, layout.LTChar):
+        return [layout_object]
+    elif isinstance(layout_object, layout.LTContainer):
+        return [
+            char for child in layout_object for char in _read_chars(child)
+        ]
+    else:
+        return []
+
+
+def _read_rows(chars):
+    """Returns rows of cells from top to bottom of page.
+
+    Characters on the same line are joined into cells, which are split where 
+    gap between characters is wider than font size. Narrower gaps of words 
+    are kept as spaces.
+
+    Returns:
+        A list of rows, each of which is a list of (x0, x1, text) of cells 
+        from left to right, where x0 and x1 are left and right edges of cell.
+    """
+    chars = [char for char in chars if char.get_text().strip()]
+    chars.sort(key=lambda char: -(char.y0 + char.y1) / 2)
+
+    lines = []
+    for char in chars:
+        y = (char.y0 + char.y1) / 2
+        if lines and lines[-1][0] - y <= char.size / 2:
+            lines[-1][1].append(char)
+        else:
+            lines.append((y, [char]))
+
+    rows = []
+    for _, line in lines:
+        line.sort(key=lambda char: char.x0)
+        cells = []
+        for char in line:
+            gap = char.x0 - cells[-1][1] if cells else None
+            if gap is not None and gap <= char.size:
+                x0, _, text = cells[-1]
+                space = ' ' if gap > char.size / 5 else ''
+                cells[-1] = (x0, char.x1, text + space + char.get_text())
+            else:
+                cells.append((char.x0, char.x1, char.get_text()))
+        rows.append(cells)
+
+    return rows
+
+
+def _select_hsbc_transactions_native(rows):
+    """Returns amounts of transaction rows of HSBC credit card bill.
+
+    Transaction rows start with a date and end with an amount. Since amounts 
+    are right-aligned, amount column is where right edges of most such rows 
+    are, which excludes amounts outside the table such as summaries.
+
+    Args:
+        rows: Rows of cells of all pages as returned by _read_rows.
+    """
+    date = re.compile(r'\d{2,4}/\d{1,2}(/\d{1,2})?\b')
+    amount = re.compile(r'-?\d{1,3}(,\d{3})*(\.\d+)?$')
+    edge_tolerance = 2
+
+    candidates = [
+        row for row in rows if len(row) > 1 and date.match(row[0][2]) and
+        amount.match(row[-1][2])
+    ]
+    if not candidates:
+        return pd.Series([], dtype=object)
+
+    edges = [row[-1][1] for row in candidates]
+    amount_edge = max(edges,
+                      key=lambda edge: sum(
+                          abs(edge - other) <= edge_tolerance
+                          for other in edges))
+
+    amounts = [
+        row[-1][2] for row in candidates
+        if abs(row[-1][1] - amount_edge) <= edge_tolerance
+    ]
+    return pd.Series(amounts, dtype=object)
+
+
+def _read_hsbc_transactions_native(file, password, start_page):
+    """Returns transactions of HSBC credit card bill extracted by pdfminer.
+
+    Pure-Python alternative of tabula. pdfminer decodes text by encodings 
+    and ToUnicode CMaps of fonts, follows form XObjects, and gives glyph 
+    boxes, from which rows and right-aligned amounts are found.
+    """
+    # Imported here so that other backends work without pdfminer installed.
+    from pdfminer import high_level
+
+    # From start page to the last page.
+    page_numbers = range(start_page - 1, sys.maxsize)
+    rows = []
+    for page in high_level.extract_pages(file,
+                                         password=password,
+                                         page_numbers=page_numbers):
+        rows += _read_rows(_read_chars(page))
+
+    return _select_hsbc_transactions_native(rows)
+
+
+# Backends to extract transactions of HSBC credit card bill.
+HSBC_BACKENDS = ('tabula',)
+
+# Backends not yet validated against bills used in tests.
+_EXPERIMENTAL_HSBC_BACKENDS = ('native',)
+
+
+def read_hsbc(file, password=None, backend='tabula'):
     """Returns transactions of HSBC credit card bill.
     
     Args:
         file: File of HSBC credit card bill.
+        password: Password of file. Asked on screen if not given.
+        backend: One of HSBC_BACKENDS to extract transactions of file. 
+            'tabula' requires Java runtime. Experimental 'native' requires 
+            pdfminer.six instead.
+
+    Raises:
+        ValueError: Backend is not supported.
     """
-    password = getpass.getpass('Password: ')
+    if backend not in HSBC_BACKENDS + _EXPERIMENTAL_HSBC_BACKENDS:
+        raise ValueError('Backend {} is not supported.'.format(backend))
 
-    pdf = PyPDF2.PdfFileReader(open(file, mode='rb'))
-    pdf.decrypt(password)
-    number_of_pages = pdf.getNumPages()
+    if password is None:
+        password = getpass.getpass('Password: ')
 
     start_page = 2
-    pages = str(start_page) + '-' + str(number_of_pages)
-    df_bill_tables = tabula.read_pdf(file,
-                                     password=password,
-                                     pages=pages,
-                                     pandas_options={'header': None})
+    if backend == 'native':
+        return _read_hsbc_transactions_native(file, password, start_page)
+
+    pdf = PyPDF2.PdfFileReader(open(file, mode='rb'))
+    pdf.decrypt(password)
+    df_bill_tables = _read_hsbc_tables_tabula(file, password, pdf, start_page)
 
     s_bill_tables = []
     for count, df_bill_table in enumerate(df_bill_tables):
@@ -341,21 +580,175 @@ def read_cathay(file):
     return df_bill
 
 
-def read_transactions(last_directory):
+class TransactionCache(object):
+    """Class to cache transactions parsed from credit card bills.
+
+    Transactions are stored under a hash of contents of bill and parser 
+    version, so rerunning on the same bill skips parsing. Transactions of 
+    password-protected bills are encrypted with password of bill. Least 
+    recently used entries are evicted when number of entries exceeds limit.
+    """
+    def __init__(self, cache_dir, max_entries=32):
+        """Initializes instance object.
+
+        Args:
+            cache_dir: Directory of cached transactions.
+            max_entries: Maximum number of cached bills.
+        """
+        self._cache_dir = cache_dir
+        self._max_entries = max_entries
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, file, parser):
+        """Returns key of bill.
+
+        Args:
+            file: File of credit card bill.
+            parser: Name of parser of bill.
+        """
+        sha256 = hashlib.sha256()
+        sha256.update('{}:{}:'.format(_PARSER_VERSION, parser).encode())
+        with open(file, mode='rb') as f:
+            for chunk in iter(lambda: f.read(1 << 16), b''):
+                sha256.update(chunk)
+        return sha256.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self._cache_dir, key + '.cache')
+
+    def get(self, key, password=None):
+        """Returns cached transactions, or None if not cached.
+
+        Args:
+            key: Key of bill.
+            password: Password the transactions were encrypted with.
+        """
+        path = self._path(key)
+        try:
+            with open(path, mode='rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+
+        if password is not None:
+            data = _decrypt(data, password)
+            # True if password is wrong or entry is corrupted.
+            if data is None:
+                return None
+
+        # Misses if entry is corrupted or of another format.
+        try:
+            entry = json.loads(data.decode('utf_8'))
+            transactions = pd.Series(entry['values'],
+                                     index=entry['index'],
+                                     dtype=object)
+        except (KeyError, TypeError, ValueError):
+            return None
+
+        # Marks entry as recently used.
+        os.utime(path)
+        return transactions
+
+    def put(self, key, transactions, password=None):
+        """Caches transactions and evicts least recently used entries.
+
+        Args:
+            key: Key of bill.
+            transactions: Transactions to be cached.
+            password: Password to encrypt transactions with.
+        """
+        entry = {
+            'index': transactions.index.tolist(),
+            'values': transactions.tolist()
+        }
+        data = json.dumps(entry, ensure_ascii=False).encode('utf_8')
+        if password is not None:
+            data = _encrypt(data, password)
+
+        path = self._path(key)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, mode='wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        self._evict()
+
+    def _evict(self):
+        paths = [
+            os.path.join(self._cache_dir, name)
+            for name in os.listdir(self._cache_dir) if name.endswith('.cache')
+        ]
+        paths.sort(key=os.path.getmtime, reverse=True)
+        for path in paths[self._max_entries:]:
+            os.remove(path)
+
+
+def _fernet(password, salt):
+    """Returns Fernet of key derived from password by PBKDF2."""
+    # Imported here so that caching of unencrypted bills works without it.
+    from cryptography import fernet
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.kdf import pbkdf2
+
+    kdf = pbkdf2.PBKDF2HMAC(algorithm=hashes.SHA256(),
+                            length=32,
+                            salt=salt,
+                            iterations=480000)
+    key = base64.urlsafe_b64encode(kdf.derive(password.encode('utf_8')))
+    return fernet.Fernet(key)
+
+
+def _encrypt(data, password):
+    """Returns data encrypted and authenticated with password."""
+    salt = os.urandom(16)
+    return salt + _fernet(password, salt).encrypt(data)
+
+
+def _decrypt(data, password):
+    """Returns data decrypted with password, or None if not authentic."""
+    from cryptography import fernet
+
+    salt, token = data[:16], data[16:]
+    try:
+        return _fernet(password, salt).decrypt(token)
+    except fernet.InvalidToken:
+        return None
+
+
+def read_transactions(last_directory, cache=None, hsbc_backend='tabula'):
     """Returns transactions of credit card bill.
+
+    Args:
+        last_directory: Initial directory of dialog.
+        cache: TransactionCache of parsed transactions. Not cached if None.
+        hsbc_backend: One of HSBC_BACKENDS to extract tables of HSBC bill.
     """
     file = read_file(title='Select credit card bill',
                      initialdir=last_directory)
 
     # True if file is from HSBC Bank.
     if 'eStatement_' in file:
-        return read_hsbc(file)
+        parser = 'hsbc_' + hsbc_backend
+        password = getpass.getpass('Password: ')
+        read = functools.partial(read_hsbc, file, password, hsbc_backend)
     # True if file is from Cathay United Bank.
     elif 'Download' in file:
-        return read_cathay(file)
+        parser = 'cathay'
+        password = None
+        read = functools.partial(read_cathay, file)
     else:
         raise FileNotFoundError('Selected file is not supported bill.')
 
+    if cache is None:
+        return read()
+
+    key = cache.key(file, parser)
+    transactions = cache.get(key, password)
+    if transactions is None:
+        transactions = read()
+        cache.put(key, transactions, password)
+    return transactions
+
 
 def main():
     """The first function to execute when running this module.
@@ -371,8 +764,14 @@ def main():
         os.path.join(output_dir, 'frequent.csv'))
     andro_money.output_all_categories(os.path.join(output_dir, 'all.csv'))
 
-    # Reads transactions from credit card bill.
-    transactions = read_transactions(andro_money.last_directory)
+    # Reads transactions from credit card bill, or from cache if read before.
+    cache = TransactionCache(os.path.join(output_dir, 'cache'))
+    hsbc_backend = os.environ.get('HSBC_BACKEND', 'tabula')
+    if hsbc_backend not in HSBC_BACKENDS:
+        raise ValueError('HSBC_BACKEND must be one of {}.'.format(
+            ', '.join(HSBC_BACKENDS)))
+    transactions = read_transactions(andro_money.last_directory, cache,
+                                     hsbc_backend)
 
     # Appends transactions to newly-copied AndroMoney file.
     andro_money.append(transactions, output_dir)
@@ -0,0 +1,52 @@
+"""Compares latencies of backends extracting transactions of HSBC bill.
+
+Usage:
+    python test/benchmark_hsbc_backends.py [bill] [repeats]
+
+Password of bill is read from environment variable PASSWORD, which can be set 
+in .env as for tests.
+
+MIT License
+Copyright (c) 2019 WU, YI-HUNG
+
+Third party copyrights:
+    HSBC PDF file: (c) Copyright. HSBC Bank (Taiwan) Company 
+        Limited 2019.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import bill_to_csv
+import dotenv
+import os
+import sys
+import timeit
+
+from os import path
+
+
+def main():
+    """The first function to execute when running this module.
+    """
+    test_dir = path.dirname(path.relpath(__file__))
+    file = (sys.argv[1] if len(sys.argv) > 1 else path.join(
+        test_dir, 'inputs', 'eStatement_202004.pdf'))
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    dotenv.load_dotenv()
+    password = os.environ.get('PASSWORD')
+
+    for backend in (bill_to_csv.HSBC_BACKENDS +
+                    bill_to_csv._EXPERIMENTAL_HSBC_BACKENDS):
+        seconds = min(
+            timeit.repeat(
+                lambda: bill_to_csv.read_hsbc(file, password, backend),
+                number=1,
+                repeat=repeats))
+        print('{}: {:.3f} s'.format(backend, seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -23,6 +23,7 @@ import datetime
 import dotenv
 import freezegun
 import os
+import tempfile
 import unittest
 
 import numpy as np
@@ -207,14 +208,19 @@ class TestReadAppend(unittest.TestCase):
         self._andro_money = bill_to_csv.AndroMoney(num_freq_categories=20,
                                                    last_directory='')
 
-    def _get_mock_transactions(self, file_name, read_file, getpass):
+    def _get_mock_transactions(self,
+                               file_name,
+                               read_file,
+                               getpass,
+                               hsbc_backend='tabula'):
         read_file.return_value = path.join(self._test_dir, self._in_dir,
                                            file_name)
 
         dotenv.load_dotenv()
         getpass.return_value = os.environ.get('PASSWORD')
 
-        mock_transactions = bill_to_csv.read_transactions(last_directory='')
+        mock_transactions = bill_to_csv.read_transactions(
+            last_directory='', hsbc_backend=hsbc_backend)
         return mock_transactions
 
     @mock.patch('bill_to_csv.getpass.getpass')
@@ -238,17 +244,21 @@ class TestReadAppend(unittest.TestCase):
     @mock.patch('bill_to_csv.getpass.getpass')
     @mock.patch('bill_to_csv.read_file')
     def test_read_hsbc_2_pages_transactions(self, read_file, getpass):
+        """Tests each backend, including experimental ones to validate them."""
         input_file = 'eStatement_202004.pdf'
-        transactions = self._get_mock_transactions(input_file, read_file,
-                                                   getpass)
-
         ref_filepath = path.join(self._test_dir, self._ref_dir,
                                  'hsbc_2_pages_transactions.csv')
         transactions_ref = pd.read_csv(ref_filepath, index_col=0, squeeze=True)
-
-        ndarray = transactions.to_numpy()
         ndarray_ref = transactions_ref.to_numpy()
-        self.assertTrue(np.array_equal(ndarray, ndarray_ref))
+
+        for hsbc_backend in (bill_to_csv.HSBC_BACKENDS +
+                             bill_to_csv._EXPERIMENTAL_HSBC_BACKENDS):
+            with self.subTest(hsbc_backend=hsbc_backend):
+                transactions = self._get_mock_transactions(
+                    input_file, read_file, getpass, hsbc_backend=hsbc_backend)
+
+                ndarray = transactions.to_numpy()
+                self.assertTrue(np.array_equal(ndarray, ndarray_ref))
 
     @mock.patch('bill_to_csv.getpass.getpass')
     @mock.patch('bill_to_csv.read_file')
@@ -328,5 +338,191 @@ class TestReadAppend(unittest.TestCase):
         self._test_append_transactions(transactions, 'AndroMoney_cathay.csv')
 
 
+class TestSelectHsbcTransactionsNative(unittest.TestCase):
+    def test_right_aligned_amounts(self):
+        # Amounts end at x=500 but start at different x.
+        rows = [
+            [(50, 180, 'HSBC Statement 2019/11/20')],
+            [(50, 92, 'Total due'), (529, 560, '99,999')],
+            [(50, 75, '11/01'), (130, 176, 'SHOP A'), (494.4, 500, '3')],
+            [(50, 75, '11/02'), (130, 176, 'SHOP B'), (488.9, 500, '60')],
+            [(50, 75, '11/03'), (130, 176, 'SHOP C'), (483.3, 500, '660')],
+            [(50, 75, '11/04'), (130, 176, 'SHOP D'), (475.0, 500, '2,918')],
+            [(50, 75, '11/05'), (130, 176, 'SHOP E'), (469.4, 500, '10,976')],
+            [(50, 75, '11/06'), (130, 176, 'SHOP F 2019')],
+            [(50, 75, '11/30'), (300, 360, 'Balance'), (529, 560, '14,617')],
+            [(50, 101, 'Page 1 of 2')],
+        ]
+        transactions = bill_to_csv._select_hsbc_transactions_native(rows)
+        self.assertListEqual(list(transactions),
+                             ['3', '60', '660', '2,918', '10,976'])
+
+
+class TestAndroMoneyReload(unittest.TestCase):
+    _header = ('AndroMoney,,,,,,,,,,,,,\r\n'
+               'Id,Currency,Amount,Category,Sub-Category,Date,'
+               'Expense(Transfer Out),Income(Transfer In),Note,Periodic,'
+               'Project,Payee/Payer,uid,Time\r\n')
+
+    @freezegun.freeze_time('2019-05-20')
+    @mock.patch('bill_to_csv.read_file')
+    def setUp(self, read_file):
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._file = path.join(self._temp_dir.name, 'AndroMoney.csv')
+        self._write(self._header + self._rows(0, 30), mode='w')
+
+        read_file.return_value = self._file
+        self._andro_money = bill_to_csv.AndroMoney(num_freq_categories=20,
+                                                   last_directory='')
+
+    def tearDown(self):
+        self._temp_dir.cleanup()
+
+    def _rows(self, start, stop):
+        categories = [('餐飲食品', '午餐'), ('餐飲食品', '晚餐'), ('運輸交通', '加油'),
+                      ('居家生活', '房租'), ('休閒娛樂', '運動'), ('醫療保健', '藥物')]
+        rows = []
+        for i in range(start, stop):
+            # Later rows have categories absent in earlier rows.
+            category, sub_category = categories[min(i // 8, 5) - i % 2]
+            date = 20180101 + (i % 12) * 100 + i % 28 + 10000 * (i % 2)
+            rows.append('{},TWD,{},{},{},{},Cash,,,,,,{},\r\n'.format(
+                i, 10 * i, category, sub_category, date, i))
+        return ''.join(rows)
+
+    def _write(self, content, mode):
+        with open(self._file, mode=mode, encoding='cp950', newline='') as f:
+            f.write(content)
+
+    def _assert_reloaded(self, today='2019-05-20'):
+        with freezegun.freeze_time(today):
+            self._andro_money.reload()
+
+            with mock.patch('bill_to_csv.read_file') as read_file:
+                read_file.return_value = self._file
+                andro_money_ref = bill_to_csv.AndroMoney(
+                    num_freq_categories=20, last_directory='')
+
+        expenses = self._andro_money._expenses
+        expenses_ref = andro_money_ref._expenses
+        self.assertListEqual(sorted(expenses['Id']), sorted(expenses_ref['Id']))
+        self.assertEqual(list(expenses['Date']), sorted(expenses['Date']))
+        for name in [
+                '_codes_frequent', '_levels_frequent', '_codes_all',
+                '_levels_all'
+        ]:
+            self.assertListEqual(
+                [list(x) for x in getattr(self._andro_money, name)],
+                [list(x) for x in getattr(andro_money_ref, name)])
+
+    @mock.patch('bill_to_csv.pd.read_csv', wraps=pd.read_csv)
+    def test_reload_appended(self, read_csv):
+        self._write(self._rows(30, 50), mode='a')
+        self._assert_reloaded()
+
+        # Only appended rows are parsed by reload.
+        self.assertEqual(read_csv.call_args_list[0][1]['header'], None)
+        self.assertEqual(self._andro_money._num_rows, 50)
+
+    def test_reload_unchanged(self):
+        self._assert_reloaded()
+
+    def test_reload_unchanged_periods_moved(self):
+        """Tests categories of unchanged file after periods of them moved."""
+        codes_frequent = [list(x) for x in self._andro_money._codes_frequent]
+        counts_all = list(self._andro_money._counts_all)
+
+        self._assert_reloaded(today='2019-08-20')
+
+        self.assertNotEqual(
+            [list(x) for x in self._andro_money._codes_frequent],
+            codes_frequent)
+        self.assertNotEqual(list(self._andro_money._counts_all), counts_all)
+
+    def test_reload_rewritten(self):
+        self._write(self._header + self._rows(5, 40), mode='w')
+        self._assert_reloaded()
+
+
+class TestTransactionCache(unittest.TestCase):
+    def setUp(self):
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._cache_dir = self._temp_dir.name
+        self._cache = bill_to_csv.TransactionCache(self._cache_dir,
+                                                   max_entries=2)
+        self._transactions = pd.Series(['3', '6', '10,976'], index=[4, 5, 9])
+
+    def tearDown(self):
+        self._temp_dir.cleanup()
+
+    def _make_bill(self, file_name, content):
+        file = path.join(self._cache_dir, file_name)
+        with open(file, mode='wb') as f:
+            f.write(content)
+        return file
+
+    def _assert_series_equal(self, transactions, transactions_ref):
+        self.assertListEqual(list(transactions.index),
+                             list(transactions_ref.index))
+        self.assertListEqual(list(transactions), list(transactions_ref))
+
+    def test_key(self):
+        file = self._make_bill('Download.csv', b'bill')
+        file_same = self._make_bill('Download_copy.csv', b'bill')
+        file_other = self._make_bill('Download_other.csv', b'other bill')
+
+        key = self._cache.key(file, 'cathay')
+        self.assertEqual(key, self._cache.key(file_same, 'cathay'))
+        self.assertNotEqual(key, self._cache.key(file_other, 'cathay'))
+        self.assertNotEqual(key, self._cache.key(file, 'hsbc'))
+
+    def test_get_put(self):
+        self.assertIsNone(self._cache.get('key'))
+
+        self._cache.put('key', self._transactions)
+        self._assert_series_equal(self._cache.get('key'), self._transactions)
+
+    def test_get_put_encrypted(self):
+        self._cache.put('key', self._transactions, password='password')
+
+        with open(path.join(self._cache_dir, 'key.cache'), mode='rb') as f:
+            self.assertNotIn(b'10,976', f.read())
+        self.assertIsNone(self._cache.get('key', password='wrong'))
+        self._assert_series_equal(self._cache.get('key', password='password'),
+                                  self._transactions)
+
+    def test_get_wrong_format(self):
+        for content in [b'not json', b'[]', b'{"values": ["3"]}', b'"3"']:
+            with open(path.join(self._cache_dir, 'key.cache'),
+                      mode='wb') as f:
+                f.write(content)
+            self.assertIsNone(self._cache.get('key'))
+
+    def test_evict_least_recently_used(self):
+        for count, key in enumerate(['a', 'b']):
+            self._cache.put(key, self._transactions)
+            # Makes modification times distinct.
+            os.utime(path.join(self._cache_dir, key + '.cache'),
+                     (count, count))
+        self._cache.get('a')
+        self._cache.put('c', self._transactions)
+
+        self.assertIsNotNone(self._cache.get('a'))
+        self.assertIsNone(self._cache.get('b'))
+        self.assertIsNotNone(self._cache.get('c'))
+
+    @mock.patch('bill_to_csv.read_cathay')
+    @mock.patch('bill_to_csv.read_file')
+    def test_read_transactions_cached(self, read_file, read_cathay):
+        read_file.return_value = self._make_bill('Download.csv', b'bill')
+        read_cathay.return_value = self._transactions
+
+        for _ in range(2):
+            transactions = bill_to_csv.read_transactions(
+                last_directory='', cache=self._cache)
+            self._assert_series_equal(transactions, self._transactions)
+        read_cathay.assert_called_once()
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file